@@ -0,0 +1,31 @@
+import time
+import requests  # for api calls
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}  # rate limit and server errors go away by waiting, other errors do not
+
+
+def get_content(url):
+    """
+    Purpose: GET a finnhub endpoint and return the raw response body. Network errors, the 60 calls / min rate limit and
+             server errors are waited out and the api is recalled. Anything wrong with the response itself is left to the
+             decoder, which raises ValueError, so a bad response is never retried forever.
+    Parameters:
+        url: the full request url, token included
+    Return:
+        bytes content
+    """
+    while True:
+        try:
+            response = requests.get(url)
+        except requests.exceptions.RequestException as e:
+            print('api call error occured: ', e, '... waiting ', delay, ' seconds, then recalling api')
+            time.sleep(delay)
+            continue
+        if response.status_code in RETRY_STATUS_CODES:
+            print('api returned status ', response.status_code, '... waiting ', delay, ' seconds, then recalling api')
+            time.sleep(delay)
+            continue
+        return response.content
+
+
+delay = 10  # if there is an error with API call, wait this delay in seconds, then recall api
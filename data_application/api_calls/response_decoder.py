@@ -0,0 +1,122 @@
+import re  # for locating the arrays inside the raw response
+import json
+import warnings
+import numpy as np
+try:
+    import orjson  # fast json parser, used whenever it is installed
+except ImportError:
+    orjson = None
+
+INT_FIELDS = {'t': np.int64, 'v': np.int64}  # every other array is decoded as float64
+STATUS_PATTERN = re.compile(rb'"s"\s*:\s*"([^"]*)"')
+ARRAY_PATTERN = re.compile(rb'"(\w+)"\s*:\s*\[([^\]]*)\]')  # finnhub candle/indicator arrays are flat, no nested brackets
+
+
+def _parse_array(body):
+    """
+    Purpose: Parse the inside of one flat json number array into a float64 buffer. Only the wanted arrays of a response
+             are parsed, one at a time, so the python floats orjson creates never outlive a single array. Without orjson
+             numpy's C text parser is used, which creates no python floats at all but is slower.
+    Return:
+        double[] values  # nulls become nan, or None when body can not be parsed this way
+    """
+    if orjson is not None:
+        try:
+            values = orjson.loads(b'[' + body + b']')
+        except orjson.JSONDecodeError:
+            return None
+        if None in values:
+            values = [np.nan if value is None else value for value in values]
+        return np.asarray(values, dtype=np.float64)
+    if not body.strip():
+        return np.empty(0, dtype=np.float64)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)  # numpy only warns when it stops early on unparsable data
+        try:
+            values = np.fromstring(body, dtype=np.float64, sep=',')
+        except (ValueError, DeprecationWarning):
+            return None
+    if len(values) != body.count(b',') + 1:
+        return None
+    return values
+
+
+def _as_dtype(field, values):
+    dtype = INT_FIELDS.get(field, np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if dtype is np.float64:
+        return values
+    if np.isnan(values).any():  # nan has no int64 value, casting would turn it into -9223372036854775808
+        raise ValueError('finnhub response has nulls in the {} array'.format(field))
+    return values.astype(dtype)  # volumes sometimes come as 1.5e7
+
+
+def decode_arrays(raw, fields):
+    """
+    Purpose: Decode the arrays of a finnhub candle or indicator response into contiguous numpy buffers
+    Parameters:
+        raw: response body in bytes, e.g. requests.get(...).content
+        fields: array names to decode, e.g. ['o', 'h', 'l', 'c', 'v', 't'] or ['ema']
+    Return:
+        {field: ndarray}  # 't' and 'v' are int64, every other field float64
+    Raises:
+        ValueError when the status is not 'ok', a field is missing, the arrays do not have the same length or an int64
+        field ('t', 'v') holds a null
+    """
+    status = STATUS_PATTERN.search(raw)
+    if status is None or status.group(1) != b'ok':
+        raise ValueError('finnhub response status is {}'.format(status.group(1).decode() if status else 'missing'))
+    wanted = set(fields)
+    arrays = {}
+    for match in ARRAY_PATTERN.finditer(raw):
+        field = match.group(1).decode()
+        if field in wanted:
+            values = _parse_array(match.group(2))
+            if values is None:  # nulls without orjson or other oddities, let the full json parser deal with this response
+                return _decode_with_json(json.loads(raw), fields)
+            arrays[field] = _as_dtype(field, values)
+    return _validate(arrays, fields)
+
+
+def _decode_with_json(data, fields):
+    if not isinstance(data, dict) or data.get('s') != 'ok':
+        status = data.get('s', 'missing') if isinstance(data, dict) else 'missing'
+        raise ValueError('finnhub response status is {}'.format(status))
+    arrays = {}
+    for field in fields:
+        if field in data:
+            values = data[field]
+            if None in values:
+                values = [np.nan if value is None else value for value in values]
+            arrays[field] = _as_dtype(field, values)
+    return _validate(arrays, fields)
+
+
+def _validate(arrays, fields):
+    missing = [field for field in fields if field not in arrays]
+    if missing:
+        raise ValueError('finnhub response has no {} array'.format(', '.join(missing)))
+    lengths = {field: len(arrays[field]) for field in fields}
+    if len(set(lengths.values())) > 1:
+        raise ValueError('finnhub response arrays have different lengths: {}'.format(lengths))
+    return arrays
+
+
+def decode_candles(raw):
+    """
+    Purpose: Decode a stock/candle response
+    Return:
+        double[] open, double[] high, double[] low, double[] close, int64[] volume, int64[] epoch
+    """
+    arrays = decode_arrays(raw, ['o', 'h', 'l', 'c', 'v', 't'])
+    return arrays['o'], arrays['h'], arrays['l'], arrays['c'], arrays['v'], arrays['t']
+
+
+def decode_indicator(raw, fields):
+    """
+    Purpose: Decode an indicator response, e.g. decode_indicator(raw, ['macd', 'macdSignal', 'macdHist'])
+    Return:
+        a tuple with one array per field, in the order of fields
+    """
+    arrays = decode_arrays(raw, fields)
+    return tuple(arrays[field] for field in fields)
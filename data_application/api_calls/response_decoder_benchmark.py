@@ -0,0 +1,105 @@
+import json  # the stdlib parser is what requests' .json() uses
+import time
+import tracemalloc  # numpy reports its buffers to tracemalloc, so peaks of both decoders are comparable
+import argparse
+import numpy as np
+from data_application.api_calls import response_decoder
+from data_application.api_calls.response_decoder import decode_candles, decode_indicator
+
+
+def make_candle_response(bars, seed=0):
+    """
+    Purpose: Build a finnhub stock/candle response body with `bars` daily bars, 15 years of daily bars is about 3780
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.01, bars))
+    data = {
+        'c': np.round(close, 2).tolist(),
+        'h': np.round(close * 1.01, 2).tolist(),
+        'l': np.round(close * 0.99, 2).tolist(),
+        'o': np.round(close * 1.001, 2).tolist(),
+        's': 'ok',
+        't': (1262304000 + 86400 * np.arange(bars)).tolist(),
+        'v': rng.integers(1000000, 50000000, bars).tolist()
+    }
+    return json.dumps(data).encode('utf-8')
+
+
+def make_macd_response(bars, seed=0):
+    data = json.loads(make_candle_response(bars, seed))
+    rng = np.random.default_rng(seed + 1)
+    data['macd'] = rng.normal(0, 1, bars).tolist()
+    data['macdSignal'] = rng.normal(0, 1, bars).tolist()
+    data['macdHist'] = rng.normal(0, 1, bars).tolist()
+    return json.dumps(data).encode('utf-8')
+
+
+def decode_candles_with_json(raw):
+    data = json.loads(raw)
+    return data['o'], data['h'], data['l'], data['c'], data['v'], data['t']
+
+
+def decode_macd_with_json(raw):
+    data = json.loads(raw)
+    return data['macd'], data['macdSignal'], data['macdHist']
+
+
+def without_orjson(decoder):
+    """
+    Purpose: Run a decoder the way it runs where orjson is not installed
+    """
+    def run(raw):
+        installed = response_decoder.orjson
+        response_decoder.orjson = None
+        try:
+            return decoder(raw)
+        finally:
+            response_decoder.orjson = installed
+    return run
+
+
+def measure(decoder, raw, repeat):
+    """
+    Return:
+        double seconds  # best time of one decode
+        int peak  # peak bytes allocated while decoding once, the decoded result included
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decoder(raw)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    result = decoder(raw)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return best, peak
+
+
+def run_benchmark(bars=3780, repeat=20):
+    candles = make_candle_response(bars)
+    macd = make_macd_response(bars)
+    cases = [
+        ('candle json', decode_candles_with_json, candles),
+        ('candle decoder', decode_candles, candles),
+        ('candle no orjson', without_orjson(decode_candles), candles),
+        ('macd json', decode_macd_with_json, macd),
+        ('macd decoder', lambda raw: decode_indicator(raw, ['macd', 'macdSignal', 'macdHist']), macd),
+        ('macd no orjson', without_orjson(lambda raw: decode_indicator(raw, ['macd', 'macdSignal', 'macdHist'])), macd)
+    ]
+    print('{} bars, candle response {:.0f} KB, macd response {:.0f} KB'.format(bars, len(candles) / 1024, len(macd) / 1024))
+    print('{:<18}{:>12}{:>14}'.format('decoder', 'time (ms)', 'peak (KB)'))
+    for name, decoder, raw in cases:
+        seconds, peak = measure(decoder, raw, repeat)
+        print('{:<18}{:>12.3f}{:>14.1f}'.format(name, seconds * 1000, peak / 1024))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--bars', type=int, default=3780, help="bars per response, 3780 is about 15 years of daily bars")
+    parser.add_argument('--repeat', type=int, default=20, help="decodes timed per case, the best one is reported")
+
+    namespace = parser.parse_args()
+    run_benchmark(namespace.bars, namespace.repeat)
@@ -4,6 +4,13 @@ import pickle  # for creating list of sp500
 import pprint as pp  # prints json files in a more readable way, mostly for debugging
 from pymongo import MongoClient
 import time
+import numpy as np
+try:
+    from data_application.api_calls.response_decoder import decode_candles, decode_indicator  # decodes responses straight into numpy arrays
+    from data_application.api_calls.finnhub_request import get_content  # retries network errors and the rate limit only
+except ImportError:  # run as a script, python data_application/api_calls/technical_indicator_retriever.py
+    from response_decoder import decode_candles, decode_indicator
+    from finnhub_request import get_content
 
 def convert_epoch_to_datetime(epoch):
     """
@@ -16,6 +23,62 @@ def convert_epoch_to_datetime(epoch):
     return time.strftime('%Y-%m-%d', time.localtime(epoch))
 
 
+def convert_epochs_to_dates(epoch_ls):
+    """
+    Purpose: Vectorized convert_epoch_to_datetime for a whole array of bar epochs. Uses the same 6 hour shift but reads the
+             date in UTC, which gives the same dates for the midnight UTC bar epochs finnhub returns
+    Return:
+        string[] dates  # format: 'YYYY-MM-DD'
+    """
+    epoch_ls = np.asarray(epoch_ls, dtype=np.int64)
+    return np.datetime_as_string((epoch_ls + 21600).astype('datetime64[s]'), unit='D').tolist()
+
+
+def align_to_epochs(epoch_ls, series_epoch_ls, values):
+    """
+    Purpose: Place the values of one indicator response on the bars of epoch_ls by the response's own epochs. Responses
+             fetched a little later than epoch_ls can have a bar more or less
+    Parameters:
+        epoch_ls: int64[] epochs of the stored bars
+        series_epoch_ls: int64[] sorted epochs of the response, e.g. the last value of get_ema(..., withEpoch=True)
+        values: double[] one value per series epoch
+    Return:
+        double[] values  # one value per epoch in epoch_ls, nan where the response has no bar
+    """
+    epoch_ls = np.asarray(epoch_ls, dtype=np.int64)
+    aligned = np.full(len(epoch_ls), np.nan)
+    if len(series_epoch_ls) == 0:
+        return aligned
+    index = np.minimum(np.searchsorted(series_epoch_ls, epoch_ls), len(series_epoch_ls) - 1)
+    found = series_epoch_ls[index] == epoch_ls
+    aligned[found] = np.asarray(values, dtype=np.float64)[index[found]]
+    return aligned
+
+
+def build_date_dicts(epoch_ls, series_dict):
+    """
+    Purpose: Build the [{date: {label: value}}, ...] lists stored in mongo from whole arrays. Every array is converted to
+             python numbers once, mongo can not store numpy scalars. nan is stored as None, like the json responses had it
+    Parameters:
+        epoch_ls: int64[] epochs of the bars
+        series_dict: {label: double[]}, every array must have one value per epoch, see align_to_epochs
+    Return:
+        [{date: {label: value}}, ...]
+    """
+    lengths = {label: len(series) for label, series in series_dict.items()}
+    if any(length != len(epoch_ls) for length in lengths.values()):
+        raise ValueError('{} epochs do not pair with series lengths {}'.format(len(epoch_ls), lengths))
+    labels = list(series_dict)
+    columns = []
+    for series in series_dict.values():
+        series = np.asarray(series)
+        if series.dtype.kind == 'f' and np.isnan(series).any():
+            columns.append([None if np.isnan(value) else value for value in series.tolist()])
+        else:
+            columns.append(series.tolist())
+    return [{date: dict(zip(labels, values))} for date, *values in zip(convert_epochs_to_dates(epoch_ls), *columns)]
+
+
 def create_sp500_list():
     """
     Purpose: Scrape wikipedia s&p500 article to create a list of ticker symbols in the s&p500
@@ -81,27 +144,20 @@ def get_price_info(ticker, resolution, startDate, endDate):
         double[] lowPrice
         double[] closePrice
         int[] volume
+        int[] epoch  # UNIX timestamp of every bar
+    Raises:
+        ValueError when finnhub has no usable data, e.g. status 'no_data'. The indicator getters below raise the same way
     """
-    while True:
-        try:
-            data = requests.get('https://finnhub.io/api/v1/stock/candle?symbol={}&resolution={}&from={}&to={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate)).json()
-            return data['o'], data['h'], data['l'], data['c'], data['v']
-        except:
-            print('api call error occured... waiting ', delay, ' seconds, then recalling api')
-            time.sleep(delay)
+    data = get_content('https://finnhub.io/api/v1/stock/candle?symbol={}&resolution={}&from={}&to={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate))
+    return decode_candles(data)
 
 
 def get_indicator_epoch(ticker, resolution, startDate, endDate):
-    while True:
-        try:
-            data = requests.get('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=sma&timeperiod={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, 2)).json()
-            return data['t']
-        except:
-            print('api call error occured... recalling api')
-            time.sleep(delay)
+    data = get_content('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=sma&timeperiod={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, 2))
+    return decode_indicator(data, ['t'])[0]
 
 
-def get_ema(ticker, resolution, startDate, endDate, timePeriod):
+def get_ema(ticker, resolution, startDate, endDate, timePeriod, withEpoch=False):
     """
     Purpose: Get a stock's exponential moving average. https://www.investopedia.com/terms/e/ema.asp
     Parameters:
@@ -112,19 +168,17 @@ def get_ema(ticker, resolution, startDate, endDate, timePeriod):
             Examples: 1608429272
         endDate: Gather stock price ending at this date. Use same format as startDate parameter
         timePeriod: how many time periods the ema should consider. A 3 day ema would consider 3 days; A 5 week ema would consider 5 weeks etc.
+        withEpoch: also return the response's own int64[] epoch as the last value, see align_to_epochs
     Return:
         double[] ema
     """
-    while True:
-        try:
-            data = requests.get('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=ema&timeperiod={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, timePeriod)).json()
-            return data['ema']
-        except:
-            print('api call error occured... waiting ', delay, ' seconds, then recalling api')
-            time.sleep(delay)
+    data = get_content('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=ema&timeperiod={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, timePeriod))
+    if withEpoch:
+        return decode_indicator(data, ['ema', 't'])
+    return decode_indicator(data, ['ema'])[0]
 
 
-def get_rsi(ticker, resolution, startDate, endDate, timePeriod):
+def get_rsi(ticker, resolution, startDate, endDate, timePeriod, withEpoch=False):
     """
     Purpose: Get a stock's Relative Strength Index. How well or poorly a stock does against the market. https://www.investopedia.com/terms/r/rsi.asp
     Parameters:
@@ -135,19 +189,17 @@ def get_rsi(ticker, resolution, startDate, endDate, timePeriod):
             Examples: 1608429272
         endDate: Gather stock price ending at this date. Use same format as startDate parameter
         timePeriod: how many time periods the rsi should consider
+        withEpoch: also return the response's own int64[] epoch as the last value, see align_to_epochs
     Return:
         double[] rsi
     """
-    while True:
-        try:
-            data = requests.get('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=rsi&timeperiod={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, timePeriod)).json()
-            return data['rsi']
-        except:
-            print('api call error occured... waiting ', delay, ' seconds, then recalling api')
-            time.sleep(delay)
+    data = get_content('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=rsi&timeperiod={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, timePeriod))
+    if withEpoch:
+        return decode_indicator(data, ['rsi', 't'])
+    return decode_indicator(data, ['rsi'])[0]
 
 
-def get_stoch(ticker, resolution, startDate, endDate, fastKPeriod, slowKPeriod, slowDPeriod):
+def get_stoch(ticker, resolution, startDate, endDate, fastKPeriod, slowKPeriod, slowDPeriod, withEpoch=False):
     """
     Purpose: Get a stock's Stochastic Oscillator indicators. Momentum indicator comparing a particular closing price of a security to a range of its prices. Gets slow d and slow k. https://www.investopedia.com/terms/s/stochasticoscillator.asp
     Parameters:
@@ -160,21 +212,19 @@ def get_stoch(ticker, resolution, startDate, endDate, fastKPeriod, slowKPeriod,
         fastKPeriod: %K
         slowKPeriod: smoothing period   #I honestly am unsure about slowKPeriod and slowDPeriod
         slowDPeriod: %D
+        withEpoch: also return the response's own int64[] epoch as the last value, see align_to_epochs
     Return:
         double[] slowd
         double[] slowk
     """
-    while True:
-        try:
-            data = requests.get('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=stoch&fastkperiod={}&slowkperiod={}&slowdperiod={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, fastKPeriod, slowKPeriod, slowDPeriod)).json()
-            return data['slowk'], data['slowd']
-        except:
-            print('api call error occured... waiting ', delay, ' seconds, then recalling api')
-            time.sleep(delay)
+    data = get_content('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=stoch&fastkperiod={}&slowkperiod={}&slowdperiod={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, fastKPeriod, slowKPeriod, slowDPeriod))
+    if withEpoch:
+        return decode_indicator(data, ['slowk', 'slowd', 't'])
+    return decode_indicator(data, ['slowk', 'slowd'])
 
 
 
-def get_macd(ticker, resolution, startDate, endDate, fastPeriod, slowPeriod, signalPeriod):
+def get_macd(ticker, resolution, startDate, endDate, fastPeriod, slowPeriod, signalPeriod, withEpoch=False):
     """
     Purpose: Get a stock's macd lines. Momentum indicator that is used as a trigger indicator. https://www.investopedia.com/terms/m/macd.asp#:~:text=Moving%20average%20convergence%20divergence%20(MACD)%20is%20a%20trend%2Dfollowing,from%20the%2012%2Dperiod%20EMA.
     Parameters:
@@ -187,21 +237,19 @@ def get_macd(ticker, resolution, startDate, endDate, fastPeriod, slowPeriod, sig
         fastPeriod: the shorter period ema
         slowPeriod: the longer period ema. The MACD line is calculated through: (slowPeriod ema) - (fastPeriod ema)
         signalPeriod: ema of the MACD line. This is called the macd signal line
+        withEpoch: also return the response's own int64[] epoch as the last value, see align_to_epochs
     Return:
         double[] macd  # the MACD line
         double[] macdSignal  # MACD signal line
         double[] macdHist  # the MACD Histogram line, calculated through: (MACD line) - (MACD signal line)
     """
-    while True:
-        try:
-            data = requests.get('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=macd&fastperiod={}&slowperiod={}&signalperiod={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, fastPeriod, slowPeriod, signalPeriod)).json()
-            return data['macd'], data['macdSignal'], data['macdHist']
-        except:
-            print('api call error occured... waiting ', delay, ' seconds, then recalling api')
-            time.sleep(delay)
+    data = get_content('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=macd&fastperiod={}&slowperiod={}&signalperiod={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, fastPeriod, slowPeriod, signalPeriod))
+    if withEpoch:
+        return decode_indicator(data, ['macd', 'macdSignal', 'macdHist', 't'])
+    return decode_indicator(data, ['macd', 'macdSignal', 'macdHist'])
 
 
-def get_bbands(ticker, resolution, startDate, endDate, timePeriod, nbdevUp, nbdevDown):
+def get_bbands(ticker, resolution, startDate, endDate, timePeriod, nbdevUp, nbdevDown, withEpoch=False):
     """
     Purpose: Get a stock's bollingerband lines. An indicator to indicate over bought or over sold. https://www.investopedia.com/terms/b/bollingerbands.asp
     Parameters:
@@ -214,18 +262,16 @@ def get_bbands(ticker, resolution, startDate, endDate, timePeriod, nbdevUp, nbde
         timePeriod: the amount of time in a period for the simple moving average used in calculating bbands.
         nbdevUp: the upper band line
         nbdevDown: the lower band line
+        withEpoch: also return the response's own int64[] epoch as the last value, see align_to_epochs
     Return:
         double[] lowerband
         double[] middleband  # the simple moving average used to calculate lower and upper bands
         double[] upperband
     """
-    while True:
-        try:
-            data = requests.get('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=bbands&timeperiod={}&nbdevup={}&nbdevdn={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, timePeriod, nbdevUp, nbdevDown)).json()
-            return data['lowerband'], data['middleband'], data['upperband']
-        except:
-            print('api call error occured... waiting ', delay, ' seconds, then recalling api')
-            time.sleep(delay)
+    data = get_content('https://finnhub.io/api/v1/indicator?symbol={}&resolution={}&from={}&to={}&indicator=bbands&timeperiod={}&nbdevup={}&nbdevdn={}&token=br3gbbnrh5rai6tghkig'.format(ticker, resolution, startDate, endDate, timePeriod, nbdevUp, nbdevDown))
+    if withEpoch:
+        return decode_indicator(data, ['lowerband', 'middleband', 'upperband', 't'])
+    return decode_indicator(data, ['lowerband', 'middleband', 'upperband'])
 
 
 
@@ -247,270 +293,232 @@ def get_beta(ticker):
 
 
 
+def build_ticker_data(ticker):
+    """
+    Purpose: Get a stock's profile, prices and indicators and build the document stored in mongo
+    Parameters:
+        ticker: The stock's ticker symbol
+    Return:
+        dictionary ticker_data
+    Raises:
+        ValueError when finnhub has no usable data for one of the series, see response_decoder.decode_arrays
+    """
+    ticker_data = {}    # dictionary used to create json file for mongodb
+    # get company profile
+    ticker_data['ticker'] = ticker
+    company_profile = get_company_profile(ticker)
+    ticker_data['name'] = company_profile['name']
+    ticker_data['industry'] = company_profile['finnhubIndustry']
+    ticker_data['exchange'] = company_profile['exchange']
+    ticker_data['ipo'] = company_profile['ipo']
+    ticker_data['currency'] = company_profile['currency']
+    ticker_data['beta'] = get_beta(ticker)
+
+    # get dates
+    daily_epoch_ls = get_indicator_epoch(ticker, 'D', y2010, int(time.time()))
+    weekly_epoch_ls = get_indicator_epoch(ticker, 'W', y2010, int(time.time()))
+    weekly_epoch_ls = weekly_epoch_ls + WEEKLY_EPOCH_SHIFT  # add 1 day to each element in weekly_epoch_ls to make it consistent with thinkorswim
+    monthly_epoch_ls = get_indicator_epoch(ticker, 'M', y2010, int(time.time()))
+    monthly_epoch_ls = monthly_epoch_ls + MONTHLY_EPOCH_SHIFT  # subtract 2 days from each element in monthly_epoch_ls to make it consistent with thinkorswim
+
+    # get prices
+    ticker_data['price'] = []
+    resolution_ls = ['D', 'W', 'M']
+    for resolution in resolution_ls:
+        open_ls, high_ls, low_ls, close_ls, volume_ls, epoch_ls = get_price_info(ticker, resolution, y2010, int(time.time()))  # 1262304000 is epoch for the beginning of year 2010
+        if resolution == 'D':
+            resolution_label = 'daily_prices'
+        elif resolution == 'W':
+            resolution_label = 'weekly_prices'
+            epoch_ls = epoch_ls + WEEKLY_EPOCH_SHIFT
+        else:
+            resolution_label = 'monthly_prices'
+            epoch_ls = epoch_ls + MONTHLY_EPOCH_SHIFT
+        price_dict = {resolution_label: build_date_dicts(epoch_ls, {
+            'open': open_ls,
+            'high': high_ls,
+            'low': low_ls,
+            'close': close_ls,
+            'volume': volume_ls
+        })}
+        ticker_data['price'].append(price_dict)
+
+    # get indicators
+    indicators_dict = {
+        'ema': [],
+        'rsi': [],
+        'macd': [],
+        'stoch': [],
+        'bband': [],
+    }
+
+    # get ema's
+    ema_dict = {
+        'daily': [],
+        'weekly': [],
+        'monthly': []
+    }
+    ticker_data['indicators'] = []
+    # get daily ema
+    daily_ema_timeperiods_ls = [2, 5, 10, 20, 50, 100, 150, 200]
+    daily_ema_2d_ls = []
+    for timeperiod in daily_ema_timeperiods_ls:
+        values, series_epoch_ls = get_ema(ticker, 'D', y2010, int(time.time()), timeperiod, withEpoch=True)
+        daily_ema_2d_ls.append(align_to_epochs(daily_epoch_ls, series_epoch_ls, values))
+        #time.sleep(1)  # delay to avoid the 60 api calls / min limitation that finnhub imposes
+    ema_dict['daily'] = build_date_dicts(daily_epoch_ls, {
+        '2-day': daily_ema_2d_ls[0],
+        '5-day': daily_ema_2d_ls[1],
+        '10-day': daily_ema_2d_ls[2],
+        '20-day': daily_ema_2d_ls[3],
+        '50-day': daily_ema_2d_ls[4],
+        '100-day': daily_ema_2d_ls[5],
+        '200-day': daily_ema_2d_ls[6]
+    })
+    # get weekly ema
+    weekly_ema_timeperiods_ls = [2, 4, 10, 20, 30, 40]
+    weekly_ema_2d_ls = []
+    for timeperiod in weekly_ema_timeperiods_ls:
+        values, series_epoch_ls = get_ema(ticker, 'W', y2010, int(time.time()), timeperiod, withEpoch=True)
+        weekly_ema_2d_ls.append(align_to_epochs(weekly_epoch_ls, series_epoch_ls + WEEKLY_EPOCH_SHIFT, values))
+    ema_dict['weekly'] = build_date_dicts(weekly_epoch_ls, {
+        '2-week': weekly_ema_2d_ls[0],
+        '4-wwek': weekly_ema_2d_ls[1],
+        '10-week': weekly_ema_2d_ls[2],
+        '20-week': weekly_ema_2d_ls[3],
+        '30-week': weekly_ema_2d_ls[4],
+        '40-week': weekly_ema_2d_ls[5]
+    })
+    # get monthly ema
+    monthly_ema_timeperiods_ls = [2, 5, 7, 8, 10]
+    monthly_epoch_ls = get_indicator_epoch(ticker, 'M', y2010, int(time.time()))
+    monthly_ema_2d_ls = []
+    for timeperiod in monthly_ema_timeperiods_ls:
+        values, series_epoch_ls = get_ema(ticker, 'M', y2010, int(time.time()), timeperiod, withEpoch=True)
+        monthly_ema_2d_ls.append(align_to_epochs(monthly_epoch_ls, series_epoch_ls, values))
+    ema_dict['monthly'] = build_date_dicts(monthly_epoch_ls, {
+        '2-month': monthly_ema_2d_ls[0],
+        '5-month': monthly_ema_2d_ls[1],
+        '7-month': monthly_ema_2d_ls[2],
+        '8-month': monthly_ema_2d_ls[3],
+        '10-month': monthly_ema_2d_ls[4]
+    })
+    indicators_dict['ema'] = ema_dict
+
+    # get rsi
+    rsi_dict = {
+        'daily': [],
+        'weekly': []
+    }
+    daily_rsi_timeperiods_ls = [5, 7, 9, 14, 21, 28]
+    daily_rsi_2d_ls = []
+    for timeperiod in daily_rsi_timeperiods_ls:
+        values, series_epoch_ls = get_rsi(ticker, 'D', y2010, int(time.time()), timeperiod, withEpoch=True)
+        daily_rsi_2d_ls.append(align_to_epochs(daily_epoch_ls, series_epoch_ls, values))
+    rsi_dict['daily'] = build_date_dicts(daily_epoch_ls, {
+        '5-day': daily_rsi_2d_ls[0],
+        '7-day': daily_rsi_2d_ls[1],
+        '9-day': daily_rsi_2d_ls[2],
+        '14-day': daily_rsi_2d_ls[3],
+        '21-day': daily_rsi_2d_ls[4],
+        '28-day': daily_rsi_2d_ls[5]
+    })
+    weekly_rsi_timeperiods_ls = [2, 3, 4]
+    weekly_rsi_2d_ls = []
+    for timeperiod in weekly_rsi_timeperiods_ls:
+        values, series_epoch_ls = get_rsi(ticker, 'W', y2010, int(time.time()), timeperiod, withEpoch=True)
+        weekly_rsi_2d_ls.append(align_to_epochs(weekly_epoch_ls, series_epoch_ls + WEEKLY_EPOCH_SHIFT, values))
+    rsi_dict['weekly'] = build_date_dicts(weekly_epoch_ls, {
+        '2-week': weekly_rsi_2d_ls[0],
+        '3-week': weekly_rsi_2d_ls[1],
+        '4-week': weekly_rsi_2d_ls[2]
+    })
+    indicators_dict['rsi'] = rsi_dict
+
+    # get macd
+    macd_dict = {
+        'daily': [],
+        'weekly': []
+    }
+    *values_ls, series_epoch_ls = get_macd(ticker, 'D', y2010, int(time.time()), 12, 26, 9, withEpoch=True)
+    daily_macd_line, daily_signal_line, daily_macd_histogram = [align_to_epochs(daily_epoch_ls, series_epoch_ls, values) for values in values_ls]
+    macd_dict['daily'] = build_date_dicts(daily_epoch_ls, {
+        'macd': daily_macd_line,
+        'macd_signal': daily_signal_line,
+        'macd_histogram': daily_macd_histogram
+    })
+    *values_ls, series_epoch_ls = get_macd(ticker, 'W', y2010, int(time.time()), 12, 26, 9, withEpoch=True)
+    weekly_macd_line, weekly_signal_line, weekly_macd_histogram = [align_to_epochs(weekly_epoch_ls, series_epoch_ls + WEEKLY_EPOCH_SHIFT, values) for values in values_ls]
+    macd_dict['weekly'] = build_date_dicts(weekly_epoch_ls, {
+        'macd': weekly_macd_line,
+        'macd_signal': weekly_signal_line,
+        'macd_histogram': weekly_macd_histogram
+    })
+    indicators_dict['macd'] = macd_dict
+
+    # get stoch
+    stoch_dict = {
+        'daily': [],
+        'weekly': []
+    }
+    *values_ls, series_epoch_ls = get_stoch(ticker, 'D', y2010, int(time.time()), 14, 3, 3, withEpoch=True)
+    daily_slowk, daily_slowd = [align_to_epochs(daily_epoch_ls, series_epoch_ls, values) for values in values_ls]
+    stoch_dict['daily'] = build_date_dicts(daily_epoch_ls, {
+        'slowd': daily_slowd,
+        'slowk': daily_slowk
+    })
+    *values_ls, series_epoch_ls = get_stoch(ticker, 'W', y2010, int(time.time()), 14, 3, 3, withEpoch=True)
+    weekly_slowk, weekly_slowd = [align_to_epochs(weekly_epoch_ls, series_epoch_ls + WEEKLY_EPOCH_SHIFT, values) for values in values_ls]
+    stoch_dict['weekly'] = build_date_dicts(weekly_epoch_ls, {
+        'slowd': weekly_slowd,
+        'slowk': weekly_slowk
+    })
+    indicators_dict['stoch'] = stoch_dict
+
+    # get bbands
+    bband_dict = {
+        'daily': [],
+        'weekly': []
+    }
+    *values_ls, series_epoch_ls = get_bbands(ticker, 'D', y2010, int(time.time()), 20, 2, 2, withEpoch=True)
+    daily_lowerband, daily_middleband, daily_upperband = [align_to_epochs(daily_epoch_ls, series_epoch_ls, values) for values in values_ls]
+    bband_dict['daily'] = build_date_dicts(daily_epoch_ls, {
+        'lowerband': daily_lowerband,
+        'middleband': daily_middleband,
+        'upperband': daily_upperband
+    })
+    *values_ls, series_epoch_ls = get_bbands(ticker, 'W', y2010, int(time.time()), 20, 2, 2, withEpoch=True)
+    weekly_lowerband, weekly_middleband, weekly_upperband = [align_to_epochs(weekly_epoch_ls, series_epoch_ls + WEEKLY_EPOCH_SHIFT, values) for values in values_ls]
+    bband_dict['weekly'] = build_date_dicts(weekly_epoch_ls, {
+        'lowerband': weekly_lowerband,
+        'middleband': weekly_middleband,
+        'upperband': weekly_upperband
+    })
+    indicators_dict['bband'] = bband_dict
+
+    ticker_data['indicators'] = indicators_dict
+    return ticker_data
+
+
 def store_ticker_data_to_db():
     sp500 = create_sp500_list()     # create a list of s&p500 tickers
     # establish mongodb connection and insert
     client = MongoClient('localhost', 27017)
     db = client['Stock_Intellegence']
 
-    ticker_data = {}    # dictionary used to create json file for mongodb
     for ticker in sp500:
-        # get company profile
-        ticker_data['ticker'] = ticker
-        company_profile = get_company_profile(ticker)
-        ticker_data['name'] = company_profile['name']
-        ticker_data['industry'] = company_profile['finnhubIndustry']
-        ticker_data['exchange'] = company_profile['exchange']
-        ticker_data['ipo'] = company_profile['ipo']
-        ticker_data['currency'] = company_profile['currency']
-        ticker_data['beta'] = get_beta(ticker)
-
-        # get dates
-        daily_epoch_ls = get_indicator_epoch(ticker, 'D', y2010, int(time.time()))
-        weekly_epoch_ls = get_indicator_epoch(ticker, 'W', y2010, int(time.time()))
-        weekly_epoch_ls = [x+86400 for x in weekly_epoch_ls]  # add 1 day to each element in weekly_epoch_ls to make it consistent with thinkorswim
-        monthly_epoch_ls = get_indicator_epoch(ticker, 'M', y2010, int(time.time()))
-        monthly_epoch_ls = [x-172800 for x in monthly_epoch_ls]  # subtract 2 days from each element in monthly_epoch_ls to make it consistent with thinkorswim
-
-        # get prices
-        ticker_data['price'] = []
-        resolution_ls = ['D', 'W', 'M']
-        for resolution in resolution_ls:
-            open_ls, high_ls, low_ls, close_ls, volume_ls = get_price_info(ticker, resolution, y2010, int(time.time()))  # 1262304000 is epoch for the beginning of year 2010
-            if resolution == 'D':
-                resolution_label = 'daily_prices'
-                epoch_ls = daily_epoch_ls
-            elif resolution == 'W':
-                resolution_label = 'weekly_prices'
-                epoch_ls = weekly_epoch_ls
-            else:
-                resolution_label = 'monthly_prices'
-                epoch_ls = monthly_epoch_ls
-            price_dict = {resolution_label: []}
-            for i in range(len(epoch_ls)):
-                date = convert_epoch_to_datetime(epoch_ls[i])
-                open = open_ls[i]
-                high = high_ls[i]
-                low = low_ls[i]
-                close = close_ls[i]
-                volume = volume_ls[i]
-                date_dict = {
-                    date: {
-                        'open': open,
-                        'high': high,
-                        'low': low,
-                        'close': close,
-                        'volume': volume
-                    }
-                }
-                price_dict[resolution_label].append(date_dict)
-            ticker_data['price'].append(price_dict)
-
-        # get indicators
-        indicators_dict = {
-            'ema': [],
-            'rsi': [],
-            'macd': [],
-            'stoch': [],
-            'bband': [],
-        }
-
-        # get ema's
-        ema_dict = {
-            'daily': [],
-            'weekly': [],
-            'monthly': []
-        }
-        ticker_data['indicators'] = []
-        # get daily ema
-        daily_ema_timeperiods_ls = [2, 5, 10, 20, 50, 100, 150, 200]
-        daily_ema_2d_ls = []
-        for timeperiod in daily_ema_timeperiods_ls:
-            daily_ema_2d_ls.append(get_ema(ticker, 'D', y2010, int(time.time()), timeperiod))
-            #time.sleep(1)  # delay to avoid the 60 api calls / min limitation that finnhub imposes
-        for i in range(len(daily_epoch_ls)):
-            date = convert_epoch_to_datetime(daily_epoch_ls[i])
-            date_dict = {
-                date: {
-                    '2-day': daily_ema_2d_ls[0][i],
-                    '5-day': daily_ema_2d_ls[1][i],
-                    '10-day': daily_ema_2d_ls[2][i],
-                    '20-day': daily_ema_2d_ls[3][i],
-                    '50-day': daily_ema_2d_ls[4][i],
-                    '100-day': daily_ema_2d_ls[5][i],
-                    '200-day': daily_ema_2d_ls[6][i]
-                }
-            }
-            ema_dict['daily'].append(date_dict)
-        # get weekly ema
-        weekly_ema_timeperiods_ls = [2, 4, 10, 20, 30, 40]
-        weekly_ema_2d_ls = []
-        for timeperiod in weekly_ema_timeperiods_ls:
-            weekly_ema_2d_ls.append(get_ema(ticker, 'W', y2010, int(time.time()), timeperiod))
-        for i in range(len(weekly_epoch_ls)):
-            date = convert_epoch_to_datetime(weekly_epoch_ls[i])
-            date_dict = {
-                date: {
-                    '2-week': weekly_ema_2d_ls[0][i],
-                    '4-wwek': weekly_ema_2d_ls[1][i],
-                    '10-week': weekly_ema_2d_ls[2][i],
-                    '20-week': weekly_ema_2d_ls[3][i],
-                    '30-week': weekly_ema_2d_ls[4][i],
-                    '40-week': weekly_ema_2d_ls[5][i]
-                }
-            }
-            ema_dict['weekly'].append(date_dict)
-        # get monthly ema
-        monthly_ema_timeperiods_ls = [2, 5, 7, 8, 10]
-        monthly_epoch_ls = get_indicator_epoch(ticker, 'M', y2010, int(time.time()))
-        monthly_ema_2d_ls = []
-        for timeperiod in monthly_ema_timeperiods_ls:
-            monthly_ema_2d_ls.append(get_ema(ticker, 'M', y2010, int(time.time()), timeperiod))
-        for i in range(len(monthly_epoch_ls)):
-            date = convert_epoch_to_datetime(monthly_epoch_ls[i])
-            date_dict = {
-                date: {
-                    '2-month': monthly_ema_2d_ls[0][i],
-                    '5-month': monthly_ema_2d_ls[1][i],
-                    '7-month': monthly_ema_2d_ls[2][i],
-                    '8-month': monthly_ema_2d_ls[3][i],
-                    '10-month': monthly_ema_2d_ls[4][i]
-                }
-            }
-            ema_dict['monthly'].append(date_dict)
-        indicators_dict['ema'] = ema_dict
-
-        # get rsi
-        rsi_dict = {
-            'daily': [],
-            'weekly': []
-        }
-        daily_rsi_timeperiods_ls = [5, 7, 9, 14, 21, 28]
-        daily_rsi_2d_ls = []
-        for timeperiod in daily_rsi_timeperiods_ls:
-            daily_rsi_2d_ls.append(get_rsi(ticker, 'D', y2010, int(time.time()), timeperiod))
-        for i in range(len(daily_epoch_ls)):
-            date = convert_epoch_to_datetime(daily_epoch_ls[i])
-            date_dict = {
-                date: {
-                    '5-day': daily_rsi_2d_ls[0][i],
-                    '7-day': daily_rsi_2d_ls[1][i],
-                    '9-day': daily_rsi_2d_ls[2][i],
-                    '14-day': daily_rsi_2d_ls[3][i],
-                    '21-day': daily_rsi_2d_ls[4][i],
-                    '28-day': daily_rsi_2d_ls[5][i]
-                }
-            }
-            rsi_dict['daily'].append(date_dict)
-        weekly_rsi_timeperiods_ls = [2, 3, 4]
-        weekly_rsi_2d_ls = []
-        for timeperiod in weekly_rsi_timeperiods_ls:
-            weekly_rsi_2d_ls.append(get_rsi(ticker, 'W', y2010, int(time.time()), timeperiod))
-        for i in range(len(weekly_epoch_ls)):
-            date = convert_epoch_to_datetime(weekly_epoch_ls[i])
-            date_dict = {
-                date: {
-                    '2-week': weekly_rsi_2d_ls[0][i],
-                    '3-week': weekly_rsi_2d_ls[1][i],
-                    '4-week': weekly_rsi_2d_ls[2][i]
-                }
-            }
-            rsi_dict['weekly'].append(date_dict)
-        indicators_dict['rsi'] = rsi_dict
-
-        # get macd
-        macd_dict = {
-            'daily': [],
-            'weekly': []
-        }
-        daily_macd_line, daily_signal_line, daily_macd_histogram = get_macd(ticker, 'D', y2010, int(time.time()), 12, 26, 9)
-        for i in range(len(daily_epoch_ls)):
-            date = convert_epoch_to_datetime(daily_epoch_ls[i])
-            date_dict = {
-                date: {
-                    'macd': daily_macd_line[i],
-                    'macd_signal': daily_signal_line[i],
-                    'macd_histogram': daily_macd_histogram[i]
-                }
-            }
-            macd_dict['daily'].append(date_dict)
-        weekly_macd_line, weekly_signal_line, weekly_macd_histogram = get_macd(ticker, 'W', y2010, int(time.time()), 12, 26, 9)
-        for i in range(len(weekly_epoch_ls)):
-            date = convert_epoch_to_datetime(weekly_epoch_ls[i])
-            date_dict = {
-                date: {
-                    'macd': weekly_macd_line[i],
-                    'macd_signal': weekly_signal_line[i],
-                    'macd_histogram': weekly_macd_histogram[i]
-                }
-            }
-            macd_dict['weekly'].append(date_dict)
-        indicators_dict['macd'] = macd_dict
-
-        # get stoch
-        stoch_dict = {
-            'daily': [],
-            'weekly': []
-        }
-        daily_slowk, daily_slowd = get_stoch(ticker, 'D', y2010, int(time.time()), 14, 3, 3)
-        for i in range(len(daily_epoch_ls)):
-            date = convert_epoch_to_datetime(daily_epoch_ls[i])
-            date_dict = {
-                date: {
-                    'slowd': daily_slowd[i],
-                    'slowk': daily_slowk[i]
-                }
-            }
-            stoch_dict['daily'].append(date_dict)
-        weekly_slowk, weekly_slowd = get_stoch(ticker, 'W', y2010, int(time.time()), 14, 3, 3)
-        for i in range(len(weekly_epoch_ls)):
-            date = convert_epoch_to_datetime(weekly_epoch_ls[i])
-            date_dict = {
-                date: {
-                    'slowd': weekly_slowd[i],
-                    'slowk': weekly_slowk[i]
-                }
-            }
-            stoch_dict['weekly'].append(date_dict)
-        indicators_dict['stoch'] = stoch_dict
-
-        # get bbands
-        bband_dict = {
-            'daily': [],
-            'weekly': []
-        }
-        daily_lowerband, daily_middleband, daily_upperband = get_bbands(ticker, 'D', y2010, int(time.time()), 20, 2, 2)
-        for i in range(len(daily_epoch_ls)):
-            date = convert_epoch_to_datetime(daily_epoch_ls[i])
-            date_dict = {
-                date: {
-                    'lowerband': daily_lowerband[i],
-                    'middleband': daily_middleband[i],
-                    'upperband': daily_upperband[i]
-                }
-            }
-            bband_dict['daily'].append(date_dict)
-        weekly_lowerband, weekly_middleband, weekly_upperband = get_bbands(ticker, 'W', y2010, int(time.time()), 20, 2, 2)
-        for i in range(len(weekly_epoch_ls)):
-            date = convert_epoch_to_datetime(weekly_epoch_ls[i])
-            date_dict = {
-                date: {
-                    'lowerband': weekly_lowerband[i],
-                    'middleband': weekly_middleband[i],
-                    'upperband': weekly_upperband[i]
-                }
-            }
-            bband_dict['weekly'].append(date_dict)
-        indicators_dict['bband'] = bband_dict
-
-        ticker_data['indicators'] = indicators_dict
-
+        try:
+            ticker_data = build_ticker_data(ticker)
+        except ValueError as e:  # the same bad response would come back on every retry
+            print('skipping ', ticker, ': ', e)
+            continue
         # insert ticker_data dictionary
         collection = db[ticker]
         collection.insert_one(ticker_data)
 
-
 y2010 = 1262304000  # the year 2010 in epoch
+WEEKLY_EPOCH_SHIFT = 86400  # weekly bars are dated 1 day later to be consistent with thinkorswim
+MONTHLY_EPOCH_SHIFT = -172800  # monthly bars are dated 2 days earlier to be consistent with thinkorswim
 delay = 10  # if there is an error with API call, wait this delay in seconds, then recall api
 
 store_ticker_data_to_db()
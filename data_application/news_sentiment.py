@@ -0,0 +1,235 @@
+import re  # for splitting articles into words
+import hashlib  # for memoizing scores by article content
+import datetime
+from zoneinfo import ZoneInfo  # for the exchange time zone
+import argparse
+from multiprocessing import Pool  # scoring runs in worker processes
+import numpy as np
+from pymongo import MongoClient, UpdateOne
+from data_application.web_scrapers import news_articles_retriever as news
+
+# small finance lexicon in the spirit of Loughran-McDonald, words are matched after lower casing
+POSITIVE_WORDS = {
+    'beat', 'beats', 'boost', 'boosts', 'bullish', 'climb', 'climbs', 'gain', 'gains', 'grow', 'growth', 'grows',
+    'high', 'higher', 'improve', 'improved', 'improves', 'jump', 'jumps', 'outperform', 'outperforms', 'profit',
+    'profitable', 'profits', 'rally', 'rallies', 'record', 'rebound', 'rise', 'rises', 'soar', 'soars', 'strong',
+    'stronger', 'surge', 'surges', 'top', 'tops', 'upgrade', 'upgraded', 'upgrades', 'win', 'wins'
+}
+NEGATIVE_WORDS = {
+    'bankruptcy', 'bearish', 'cut', 'cuts', 'decline', 'declines', 'default', 'deficit', 'downgrade', 'downgraded',
+    'downgrades', 'drop', 'drops', 'fall', 'falls', 'fined', 'fraud', 'investigation', 'lawsuit', 'layoff',
+    'layoffs', 'lose', 'loses', 'loss', 'losses', 'low', 'lower', 'miss', 'misses', 'plunge', 'plunges', 'probe',
+    'recall', 'recession', 'sell-off', 'selloff', 'slump', 'slumps', 'tumble', 'tumbles', 'underperform', 'weak',
+    'weaker', 'warning', 'warns'
+}
+NEGATIONS = {'no', 'not', 'never', 'without'}
+WORD_PATTERN = re.compile(r"[a-z]+n't|[a-z]+(?:-[a-z]+)?")  # keeps "didn't" in one piece
+
+EXCHANGE_TIMEZONE = ZoneInfo('America/New_York')
+MARKET_CLOSE = np.timedelta64(16 * 3600, 's')  # 16:00 exchange time
+
+_score_memo = {}  # content hash -> score, saves the mongo round trip for articles scored by this process
+
+
+def content_hash(article):
+    """
+    Purpose: Identify an article by what is scored, so the same story re-ingested under another id or url is only scored once
+    """
+    text = '{}\n{}'.format(article.get('headline', ''), article.get('summary', ''))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def score_text(text):
+    """
+    Purpose: Lexicon sentiment of a piece of text. A word right after a negation ('not', 'never', ...) counts the other way.
+    Return:
+        double score  # (positive - negative) / (positive + negative), between -1 and 1. 0 when no lexicon word is found
+    """
+    positive = 0
+    negative = 0
+    negated = False
+    for word in WORD_PATTERN.findall(text.lower()):
+        if word in POSITIVE_WORDS:
+            if negated:
+                negative += 1
+            else:
+                positive += 1
+        elif word in NEGATIVE_WORDS:
+            if negated:
+                positive += 1
+            else:
+                negative += 1
+        negated = word in NEGATIONS or word.endswith("n't")
+    if positive + negative == 0:
+        return 0.0
+    return (positive - negative) / (positive + negative)
+
+
+def score_batch(texts):
+    return [score_text(text) for text in texts]
+
+
+def score_articles(articles, cache_collection=None, pool=None, batch_size=512):
+    """
+    Purpose: Score the headline and summary of many articles. Scores are memoized by content hash in this process and in
+             cache_collection, only articles never seen before are scored, in batches spread over the pool's workers.
+             Pass the articles of many tickers at once and reuse one pool across calls, see store_scored_news.
+    Parameters:
+        articles: list of article dictionaries as returned by news_articles_retriever.get_news_articles
+        cache_collection: mongo collection holding {'_id': content hash, 'sentiment': score}, None to only use memory
+        pool: multiprocessing.Pool, None to score in this process
+        batch_size: articles sent to a worker at once. Fewer new articles than this are scored in this process
+    Return:
+        string[] hashes
+        double[] scores  # same order as articles
+    """
+    hashes = [content_hash(article) for article in articles]
+    missing = list({h for h in hashes if h not in _score_memo})
+    if missing and cache_collection is not None:
+        for cached in cache_collection.find({'_id': {'$in': missing}}, {'sentiment': 1}):
+            _score_memo[cached['_id']] = cached['sentiment']
+
+    new_texts = {}  # content hash -> text, also drops duplicates inside articles
+    for h, article in zip(hashes, articles):
+        if h not in _score_memo:
+            new_texts[h] = '{}\n{}'.format(article.get('headline', ''), article.get('summary', ''))
+    if new_texts:
+        new_hashes = list(new_texts)
+        texts = [new_texts[h] for h in new_hashes]
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        if pool is None or len(batches) == 1:
+            scored = score_batch(texts)  # shipping a single batch to a worker costs more than scoring it here
+        else:
+            scored = [score for batch in pool.map(score_batch, batches) for score in batch]
+        _score_memo.update(zip(new_hashes, scored))
+        if cache_collection is not None:
+            cache_collection.bulk_write([UpdateOne({'_id': h}, {'$set': {'sentiment': s}}, upsert=True)
+                                         for h, s in zip(new_hashes, scored)], ordered=False)
+    return hashes, [_score_memo[h] for h in hashes]
+
+
+def store_scored_news(db, tickers, startDate, endDate, pool=None):
+    """
+    Purpose: Get the news articles of several stocks, score them all in one batch and store each article with its score
+             in the 'news' collection
+    Parameters:
+        db: the Stock_Intellegence mongo database
+        tickers: Ticker symbols of the stocks
+        startDate: When to start looking for news articles. Format is: 'YYYY-MM-DD'
+        endDate: When to stop looking for news articles. Format is: 'YYYY-MM-DD'
+        pool: multiprocessing.Pool used for scoring, see score_articles
+    Return:
+        {ticker: int number of articles stored}
+    """
+    ticker_ls = []
+    articles = []
+    for ticker in tickers:
+        for article in news.get_news_articles(ticker, startDate, endDate):
+            if isinstance(article, dict) and 'datetime' in article:
+                ticker_ls.append(ticker)
+                articles.append(article)
+    stored_counts = {ticker: 0 for ticker in tickers}
+    if not articles:
+        return stored_counts
+    hashes, scores = score_articles(articles, db['news_sentiment_cache'], pool)
+    writes = []
+    for ticker, article, h, score in zip(ticker_ls, articles, hashes, scores):
+        stored = {
+            'ticker': ticker,
+            'headline': article.get('headline', ''),
+            'summary': article.get('summary', ''),
+            'url': article.get('url', ''),
+            'source': article.get('source', ''),
+            'datetime': article['datetime'],
+            'content_hash': h,
+            'sentiment': score
+        }
+        writes.append(UpdateOne({'ticker': ticker, 'content_hash': h}, {'$set': stored}, upsert=True))
+        stored_counts[ticker] += 1
+    db['news'].create_index([('ticker', 1), ('content_hash', 1)], unique=True)  # no-op once the index exists
+    db['news'].bulk_write(writes, ordered=False)
+    return stored_counts
+
+
+def exchange_time(epochs):
+    """
+    Purpose: Convert UNIX timestamps to New York exchange local time, daylight saving time included
+    Return:
+        datetime64[s][] local times
+    """
+    utc = np.asarray(epochs, dtype=np.int64).astype('datetime64[s]')
+    days, day_index = np.unique(utc.astype('datetime64[D]'), return_inverse=True)
+    # one offset per utc day, taken at noon utc. DST switches at 2am local, so only 2am-3am ET on switch days can be off
+    offsets = []
+    for day in days.astype(str):
+        noon = datetime.datetime.fromisoformat('{}T12:00:00+00:00'.format(day))
+        offsets.append(int(noon.astimezone(EXCHANGE_TIMEZONE).utcoffset().total_seconds()))
+    offsets = np.array(offsets, dtype=np.int64)
+    return utc + offsets.astype('timedelta64[s]')[day_index.reshape(-1)]
+
+
+def daily_sentiment(epochs, scores, dates):
+    """
+    Purpose: Aggregate article scores into one value per price bar. Articles are placed in exchange time: anything
+             published at or after the 16:00 ET close counts towards the next day, and an article counts towards the
+             first bar dated on or after that day. News therefore never reaches a bar that had already closed when it was
+             published, which keeps look-ahead out of the sentiment feature. The bar before dates[0] is not known, so
+             the first bar only takes articles from the largest gap between bars before it (a long weekend for daily
+             bars) and older articles are dropped instead of piling up in it.
+    Parameters:
+        epochs: int[] article publication times, UNIX timestamp
+        scores: double[] article scores
+        dates: datetime64[D][] sorted price bar dates, e.g. the 'dates' of a ticker_decoder series
+    Return:
+        double[] sentiment  # mean article score of every bar, nan for bars without news
+        int[] count  # number of articles of every bar
+    """
+    local = exchange_time(epochs)
+    article_days = local.astype('datetime64[D]')
+    after_close = local - article_days >= MARKET_CLOSE
+    article_days = article_days + after_close.astype('timedelta64[D]')
+    bars = np.searchsorted(dates, article_days, side='left')
+    in_range = bars < len(dates)  # news newer than the last bar has no bar yet
+    if len(dates):
+        gap = np.diff(dates).max() if len(dates) > 1 else np.timedelta64(1, 'D')
+        in_range &= article_days > dates[0] - gap  # news older than the bar before the first one
+    bars = bars[in_range]
+    count = np.bincount(bars, minlength=len(dates))
+    total = np.bincount(bars, weights=np.asarray(scores, dtype=np.float64)[in_range], minlength=len(dates))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sentiment = np.where(count > 0, total / count, np.nan)
+    return sentiment, count
+
+
+def get_daily_sentiment(db, ticker, dates):
+    """
+    Purpose: Daily sentiment series of a stock aligned with its price bars, from the articles stored by store_scored_news
+    """
+    epochs = []
+    scores = []
+    for article in db['news'].find({'ticker': ticker}, {'datetime': 1, 'sentiment': 1}):
+        epochs.append(article['datetime'])
+        scores.append(article['sentiment'])
+    return daily_sentiment(np.array(epochs, dtype=np.int64), scores, dates)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('startDate', type=str, help="When to start looking for news articles. Format is: 'YYYY-MM-DD'")
+    parser.add_argument('endDate', type=str, help="When to stop looking for news articles. Format is: 'YYYY-MM-DD'")
+    parser.add_argument('--tickers', type=str, nargs='+', help="defaults to every s&p500 ticker")
+    parser.add_argument('--processes', type=int, default=None, help="number of scoring worker processes")
+    parser.add_argument('--group-size', type=int, default=50, help="tickers whose articles are scored in one batch")
+
+    namespace = parser.parse_args()
+    client = MongoClient('localhost', 27017)
+    db = client['Stock_Intellegence']
+    tickers = namespace.tickers
+    if tickers is None:
+        tickers = sorted(db['SP500'].distinct('ticker'))
+    with Pool(namespace.processes) as pool:  # one pool for the whole run
+        for i in range(0, len(tickers), namespace.group_size):
+            group = tickers[i:i + namespace.group_size]
+            for ticker, count in store_scored_news(db, group, namespace.startDate, namespace.endDate, pool).items():
+                print(ticker, count)
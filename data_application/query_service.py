@@ -0,0 +1,305 @@
+import asyncio  # the service is served by an aiohttp event loop
+import argparse
+import threading  # the change stream watcher runs next to the event loop
+from collections import OrderedDict  # for the lru cache of hot tickers
+import numpy as np
+from aiohttp import web
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from data_application.ticker_decoder import RESOLUTION_LABELS, decode_ticker_document, slice_series
+
+
+class HotTickerCache:
+    """
+    Purpose: Size bounded LRU of decoded ticker documents. Once the arrays held by the cache go over max_bytes the least
+             recently used tickers are dropped. Entries are invalidated whenever ingest writes a ticker again.
+    Parameters:
+        max_bytes: upper bound on the summed nbytes of every cached array
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # ticker -> (decoded ticker, size in bytes)
+        self._lock = threading.Lock()  # invalidations come from the change stream thread
+        self._generations = {}  # ticker -> number of times it was invalidated
+        self._clear_generation = 0  # number of times the whole cache was invalidated
+
+    def get(self, ticker):
+        with self._lock:
+            entry = self._entries.get(ticker)
+            if entry is None:
+                return None
+            self._entries.move_to_end(ticker)
+            return entry[0]
+
+    def generation(self, ticker):
+        """
+        Purpose: Snapshot taken before reading a ticker from mongo, hand it to put so a read that raced an
+                 invalidation is not cached
+        """
+        with self._lock:
+            return self._clear_generation, self._generations.get(ticker, 0)
+
+    def put(self, ticker, decoded, generation=None):
+        size = decoded_nbytes(decoded)
+        if size > self.max_bytes:  # a single ticker bigger than the whole cache is served but never kept
+            return
+        with self._lock:
+            if generation is not None and generation != (self._clear_generation, self._generations.get(ticker, 0)):
+                return  # ingest wrote the ticker while it was being read, the decoded document may be stale
+            self._pop(ticker)
+            self._entries[ticker] = (decoded, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def invalidate(self, ticker=None):
+        """
+        Purpose: Drop one ticker from the cache, or every ticker when ticker is None
+        """
+        with self._lock:
+            if ticker is None:
+                self._entries.clear()
+                self.current_bytes = 0
+                self._clear_generation += 1
+            else:
+                self._pop(ticker)
+                self._generations[ticker] = self._generations.get(ticker, 0) + 1
+
+    def _pop(self, ticker):
+        entry = self._entries.pop(ticker, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def decoded_nbytes(decoded):
+    total = 0
+    for section in (decoded['price'], decoded['indicators']):
+        for series in section.values():
+            total += sum(arr.nbytes for arr in series.values())
+    return total
+
+
+def series_to_json(series):
+    out = {}
+    for field, arr in series.items():
+        if field == 'dates':
+            out[field] = np.datetime_as_string(arr, unit='D').tolist()
+        elif np.isnan(arr).any():
+            out[field] = [None if np.isnan(value) else value for value in arr.tolist()]  # json has no nan
+        else:
+            out[field] = arr.tolist()
+    return out
+
+
+class TickerStore:
+    """
+    Purpose: Read side of the ticker collection. Decoded documents are kept in a HotTickerCache and concurrent misses for
+             the same ticker share one mongo read. A cached ticker is only served while it is still the newest document
+             stored for it, which costs one _id lookup per hit instead of reading and decoding the whole document.
+    Parameters:
+        client: pooled MongoClient, shared by every request
+        cache: HotTickerCache
+    """
+    def __init__(self, client, cache, database='Stock_Intellegence', collection='SP500'):
+        self.client = client
+        self.collection = client[database][collection]
+        self.cache = cache
+        self._in_flight = {}  # ticker -> future of the mongo read, avoids reading a hot ticker several times at once
+
+    async def get(self, ticker):
+        loop = asyncio.get_running_loop()
+        decoded = self.cache.get(ticker)
+        if decoded is not None:
+            # change streams need a replica set, so a cache hit is checked against the newest stored _id of the ticker
+            newest_id = await loop.run_in_executor(None, self._newest_id, ticker)
+            if newest_id == decoded['_id']:
+                return decoded
+            self.cache.invalidate(ticker)  # ingest inserted a newer document, or the ticker is gone
+        future = self._in_flight.get(ticker)
+        if future is None:
+            generation = self.cache.generation(ticker)
+            future = loop.run_in_executor(None, self._load, ticker)  # pymongo blocks, keep it off the event loop
+            self._in_flight[ticker] = future
+            future.add_done_callback(lambda done: self._finish_load(ticker, done, generation))
+        # shielded, so a client that disconnects does not cancel the read every other waiter shares
+        return await asyncio.shield(future)
+
+    def _finish_load(self, ticker, future, generation):
+        """
+        Purpose: Runs on the event loop once the mongo read is done, whether or not anybody is still waiting for it
+        """
+        if self._in_flight.get(ticker) is future:
+            del self._in_flight[ticker]
+        if future.cancelled() or future.exception() is not None:  # exception() also marks the error as retrieved
+            return
+        decoded = future.result()
+        if decoded is not None:
+            self.cache.put(ticker, decoded, generation)
+
+    def _load(self, ticker):
+        document = self.collection.find_one({'ticker': ticker}, sort=[('_id', -1)])  # newest ingest wins
+        if document is None:
+            return None
+        decoded = decode_ticker_document(document)
+        decoded['_id'] = document['_id']  # freshness marker, see get
+        return decoded
+
+    def _newest_id(self, ticker):
+        document = self.collection.find_one({'ticker': ticker}, {'_id': 1}, sort=[('_id', -1)])
+        return None if document is None else document['_id']
+
+    def watch_ingest_writes(self):
+        """
+        Purpose: Invalidate cached tickers whenever ingest writes to the collection. Runs in a daemon thread.
+                 Change streams need mongo to run as a replica set. On a standalone server the _id check in get still
+                 catches new ingests, this only frees the memory of stale entries sooner.
+        """
+        pipeline = [{'$project': {'operationType': 1, 'fullDocument.ticker': 1}}]
+        try:
+            with self.collection.watch(pipeline, full_document='updateLookup') as stream:
+                for change in stream:
+                    ticker = (change.get('fullDocument') or {}).get('ticker')
+                    self.cache.invalidate(ticker)  # deletes carry no ticker, so the whole cache is dropped
+        except PyMongoError as e:
+            print('change stream unavailable, cache will only be invalidated through POST /invalidate: ', e)
+
+
+def get_store(request):
+    return request.app['store']
+
+
+async def get_ticker_or_404(request):
+    ticker = request.match_info['ticker'].upper()
+    decoded = await get_store(request).get(ticker)
+    if decoded is None:
+        raise web.HTTPNotFound(text='unknown ticker: {}'.format(ticker))
+    return decoded
+
+
+def get_resolution(request):
+    resolution = request.query.get('resolution', 'D').upper()
+    if resolution not in RESOLUTION_LABELS:
+        raise web.HTTPBadRequest(text='resolution must be one of: {}'.format(', '.join(RESOLUTION_LABELS)))
+    return resolution
+
+
+def get_date_range(request):
+    start = request.query.get('start')
+    end = request.query.get('end')
+    try:
+        for date in (start, end):
+            if date is not None:
+                np.datetime64(date, 'D')
+    except ValueError:
+        raise web.HTTPBadRequest(text='start and end must be formatted as YYYY-MM-DD')
+    return start, end
+
+
+async def handle_prices(request):
+    """
+    GET /prices/{ticker}?resolution=D&start=YYYY-MM-DD&end=YYYY-MM-DD
+    """
+    decoded = await get_ticker_or_404(request)
+    resolution = get_resolution(request)
+    start, end = get_date_range(request)
+    series = decoded['price'].get(resolution)
+    if series is None:
+        raise web.HTTPNotFound(text='no {} prices for {}'.format(RESOLUTION_LABELS[resolution], decoded['ticker']))
+    return web.json_response({
+        'ticker': decoded['ticker'],
+        'resolution': resolution,
+        'prices': series_to_json(slice_series(series, start, end))
+    })
+
+
+async def handle_indicators(request):
+    """
+    GET /indicators/{ticker}?resolution=D&indicator=ema&start=YYYY-MM-DD&end=YYYY-MM-DD
+    Every stored indicator of the resolution is returned when indicator is omitted
+    """
+    decoded = await get_ticker_or_404(request)
+    resolution = get_resolution(request)
+    start, end = get_date_range(request)
+    wanted = request.query.get('indicator')
+    indicators = {}
+    for (indicator_resolution, indicator), series in decoded['indicators'].items():
+        if indicator_resolution == resolution and wanted in (None, indicator):
+            indicators[indicator] = series_to_json(slice_series(series, start, end))
+    return web.json_response({'ticker': decoded['ticker'], 'resolution': resolution, 'indicators': indicators})
+
+
+async def handle_latest(request):
+    """
+    GET /latest/{ticker}
+    The profile and the last bar of every stored price and indicator series
+    """
+    decoded = await get_ticker_or_404(request)
+    latest = {'ticker': decoded['ticker'], 'profile': decoded['profile'], 'price': {}, 'indicators': {}}
+    for resolution, series in decoded['price'].items():
+        if len(series['dates']):
+            latest['price'][resolution] = series_to_json({field: arr[-1:] for field, arr in series.items()})
+    for (resolution, indicator), series in decoded['indicators'].items():
+        if len(series['dates']):
+            last_bar = series_to_json({field: arr[-1:] for field, arr in series.items()})
+            latest['indicators'].setdefault(resolution, {})[indicator] = last_bar
+    return web.json_response(latest)
+
+
+async def handle_invalidate(request):
+    """
+    POST /invalidate/{ticker}  (use 'all' as the ticker to empty the cache)
+    """
+    ticker = request.match_info['ticker'].upper()
+    get_store(request).cache.invalidate(None if ticker == 'ALL' else ticker)
+    return web.json_response({'invalidated': ticker})
+
+
+async def handle_stats(request):
+    cache = get_store(request).cache
+    return web.json_response({'tickers': len(cache), 'bytes': cache.current_bytes, 'max_bytes': cache.max_bytes})
+
+
+def create_app(host='localhost', port=27017, max_pool_size=50, cache_mb=512, watch=True):
+    """
+    Purpose: Build the aiohttp application serving the stored ticker data
+    Parameters:
+        host, port: mongodb server
+        max_pool_size: size of the MongoClient connection pool shared by every request
+        cache_mb: size bound of the hot ticker cache in megabytes
+        watch: invalidate the cache from a mongo change stream
+    """
+    client = MongoClient(host, port, maxPoolSize=max_pool_size)
+    store = TickerStore(client, HotTickerCache(cache_mb * 1024 * 1024))
+    app = web.Application()
+    app['store'] = store
+    app.router.add_get('/prices/{ticker}', handle_prices)
+    app.router.add_get('/indicators/{ticker}', handle_indicators)
+    app.router.add_get('/latest/{ticker}', handle_latest)
+    app.router.add_post('/invalidate/{ticker}', handle_invalidate)
+    app.router.add_get('/stats', handle_stats)
+    if watch:
+        threading.Thread(target=store.watch_ingest_writes, daemon=True).start()
+
+    async def close_client(app):
+        client.close()
+    app.on_cleanup.append(close_client)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--port', type=int, default=8080, help="port the service listens on")
+    parser.add_argument('--mongo-host', type=str, default='localhost', help="mongodb host")
+    parser.add_argument('--mongo-port', type=int, default=27017, help="mongodb port")
+    parser.add_argument('--cache-mb', type=int, default=512, help="size bound of the hot ticker cache in megabytes")
+    parser.add_argument('--no-watch', action='store_true', help="do not invalidate the cache from a mongo change stream")
+
+    namespace = parser.parse_args()
+    web.run_app(create_app(namespace.mongo_host, namespace.mongo_port, cache_mb=namespace.cache_mb,
+                           watch=not namespace.no_watch), port=namespace.port)
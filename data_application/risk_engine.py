@@ -0,0 +1,296 @@
+import os  # for the on disk cache of every window
+import time
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from pymongo import MongoClient
+from data_application.ticker_decoder import decode_series
+from data_application.api_calls.response_decoder import decode_candles
+from data_application.api_calls.finnhub_request import get_content  # for the benchmark candles
+
+
+def load_daily_closes(collection, tickers=None):
+    """
+    Purpose: Read the stored daily closes of many tickers into one date aligned matrix
+    Parameters:
+        collection: mongo collection filled by mongo_connection.store_ticker_data_to_db
+        tickers: tickers to load, every stored ticker when None
+    Return:
+        datetime64[D][] dates  # union of the trading days of every ticker
+        string[] tickers
+        double[][] closes  # shape (dates, tickers), nan where a ticker has no bar on that date
+    """
+    query = {} if tickers is None else {'ticker': {'$in': list(tickers)}}
+    series_by_ticker = {}
+    for document in collection.find(query, {'ticker': 1, 'price': 1}).sort('_id', 1):  # newest ingest wins
+        for price_dict in document.get('price', []):
+            if 'daily_prices' in price_dict:
+                series_by_ticker[document['ticker']] = decode_series(price_dict['daily_prices'])
+    if tickers is None:
+        tickers = sorted(series_by_ticker)
+    missing = [ticker for ticker in tickers if ticker not in series_by_ticker]
+    if missing:
+        raise KeyError('no daily prices stored for: {}'.format(', '.join(missing)))
+
+    dates = np.unique(np.concatenate([series_by_ticker[ticker]['dates'] for ticker in tickers]))
+    closes = np.full((len(dates), len(tickers)), np.nan)
+    for j, ticker in enumerate(tickers):
+        series = series_by_ticker[ticker]
+        closes[np.searchsorted(dates, series['dates']), j] = series['close']
+    return dates, list(tickers), closes
+
+
+def load_benchmark_closes(benchmark, dates):
+    """
+    Purpose: Get the daily closes of the benchmark from finnhub, aligned with the stored dates of the universe. The
+             benchmark is usually an etf like SPY, which is not an s&p500 constituent and so never stored by ingest.
+    Parameters:
+        benchmark: ticker symbol of the benchmark
+        dates: datetime64[D][] sorted dates, as returned by load_daily_closes
+    Return:
+        double[] closes  # nan on dates the benchmark has no bar
+    Raises:
+        ValueError when finnhub has no candles for the benchmark
+    """
+    startDate = int((dates[0] - np.datetime64('1970-01-01', 'D')) / np.timedelta64(1, 's'))
+    data = get_content('https://finnhub.io/api/v1/stock/candle?symbol={}&resolution=D&from={}&to={}&token=br3gbbnrh5rai6tghkig'.format(benchmark, startDate, int(time.time()) + 86400))
+    _, _, _, close, _, epoch = decode_candles(data)  # an unknown symbol raises ValueError instead of being retried forever
+    # same 6 hour shift as technical_indicator_retriever.convert_epoch_to_datetime, so the bar dates match the stored ones
+    benchmark_dates = (epoch + 21600).astype('datetime64[s]').astype('datetime64[D]')
+    closes = np.full(len(dates), np.nan)
+    index = np.searchsorted(dates, benchmark_dates)
+    found = index < len(dates)
+    found[found] = dates[index[found]] == benchmark_dates[found]
+    closes[index[found]] = close[found]
+    return closes
+
+
+def daily_returns(closes):
+    """
+    Purpose: Simple returns of a close matrix. Row i holds the return from day i to day i + 1, nan propagates.
+    """
+    return closes[1:] / closes[:-1] - 1
+
+
+def rolling_beta(asset_returns, benchmark_returns, window, dtype=np.float64):
+    """
+    Purpose: Rolling beta of every asset against the benchmark. https://www.investopedia.com/terms/b/beta.asp
+             beta = cov(asset, benchmark) / var(benchmark) over the last `window` returns, computed for every window at
+             once from running sums. Windows holding a missing return are nan.
+    Parameters:
+        asset_returns: double[][] of shape (days, assets)
+        benchmark_returns: double[] of shape (days,)
+        window: how many returns each beta considers
+        dtype: dtype of the result. The running sums are always float64 to avoid cancellation.
+    Return:
+        double[][] beta  # shape (days - window + 1, assets), row i is the window ending on day i + window - 1
+    """
+    valid = ~np.isnan(asset_returns) & ~np.isnan(benchmark_returns)[:, None]
+    x = np.where(valid, benchmark_returns[:, None], 0.0)
+    y = np.where(valid, asset_returns, 0.0)
+
+    def window_sums(values):
+        sums = np.cumsum(values, axis=0, dtype=np.float64)
+        sums = np.concatenate([np.zeros((1, sums.shape[1])), sums])
+        return sums[window:] - sums[:-window]
+
+    count = window_sums(valid)
+    sum_x = window_sums(x)
+    sum_y = window_sums(y)
+    cov = window_sums(x * y) - sum_x * sum_y / window
+    var = window_sums(x * x) - sum_x * sum_x / window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = np.where(count == window, cov / var, np.nan)
+    return beta.astype(dtype, copy=False)
+
+
+def rolling_covariance(returns, window, end_rows, dtype=np.float64, chunk_size=32):
+    """
+    Purpose: Full covariance and correlation matrices of every asset for the windows ending on end_rows
+    Parameters:
+        returns: double[][] of shape (days, assets)
+        window: how many returns each matrix considers
+        end_rows: int[] rows of returns the windows end on, each must be >= window - 1
+        dtype: float32 halves the memory of the (len(end_rows), assets, assets) results
+        chunk_size: how many windows are multiplied at once, bounds the temporary memory to
+                    chunk_size * window * assets + chunk_size * assets * assets elements
+    Return:
+        double[][][] cov
+        double[][][] corr  # assets with a missing return inside a window are nan in that window's matrices
+    """
+    returns = returns.astype(dtype, copy=False)
+    n_assets = returns.shape[1]
+    windows = sliding_window_view(returns, window, axis=0)  # (days - window + 1, assets, window) view, no copy
+    cov = np.empty((len(end_rows), n_assets, n_assets), dtype=dtype)
+    corr = np.empty_like(cov)
+    for start in range(0, len(end_rows), chunk_size):
+        rows = np.asarray(end_rows[start:start + chunk_size]) - (window - 1)
+        block = windows[rows]
+        block = block - block.mean(axis=2, keepdims=True)  # nan stays nan, so incomplete assets drop out
+        block_cov = np.matmul(block, block.transpose(0, 2, 1)) / (window - 1)
+        std = np.sqrt(np.diagonal(block_cov, axis1=1, axis2=2))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            block_corr = block_cov / (std[:, :, None] * std[:, None, :])
+        cov[start:start + len(rows)] = block_cov
+        corr[start:start + len(rows)] = block_corr
+    return cov, corr
+
+
+class RiskEngine:
+    """
+    Purpose: Rolling beta against a configurable benchmark and the rolling covariance/correlation matrices of the whole
+             universe for one window length. Results are cached on disk per window and benchmark, a refresh only computes
+             the days that are newer than the cache, plus the windows that still ended on incomplete data last time.
+    Parameters:
+        window: how many daily returns each statistic considers. 252 is about one year
+        benchmark: ticker the betas are measured against
+        dtype: np.float64 or np.float32
+        chunk_size: windows per matrix multiplication, see rolling_covariance
+        matrix_history: how many of the most recent covariance/correlation matrices are kept. Every matrix is
+                        assets * assets elements, so keeping all of them for the whole history is not practical
+        cache_dir: where the results of every window are saved, None disables the disk cache
+    """
+    def __init__(self, window=252, benchmark='SPY', dtype=np.float64, chunk_size=32, matrix_history=21,
+                 cache_dir='risk_cache'):
+        self.window = window
+        self.benchmark = benchmark
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.matrix_history = matrix_history
+        self.cache_dir = cache_dir
+        self.results = self._load_cache()
+
+    def _cache_path(self):
+        return os.path.join(self.cache_dir, 'window_{}_{}_{}.npz'.format(self.window, self.benchmark, self.dtype.name))
+
+    def _load_cache(self):
+        if self.cache_dir is None or not os.path.exists(self._cache_path()):
+            return None
+        with np.load(self._cache_path()) as cached:
+            return {key: cached[key] for key in cached.files}
+
+    def _save_cache(self):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.savez(self._cache_path(), **self.results)
+
+    def refresh(self, dates, tickers, closes, benchmark_closes):
+        """
+        Purpose: Bring the cached results up to the last date of closes
+        Parameters:
+            dates, tickers, closes: as returned by load_daily_closes
+            benchmark_closes: double[] daily closes of the benchmark aligned with dates
+        Return:
+            {
+                'beta_dates': datetime64[D][],  # date each beta window ends on
+                'tickers': string[],
+                'beta': double[][],  # shape (beta_dates, tickers)
+                'matrix_dates': datetime64[D][],
+                'cov': double[][][],  # shape (matrix_dates, tickers, tickers)
+                'corr': double[][][],
+                'recompute_from': datetime64[D]  # windows ending on or after this date are recomputed next refresh
+            }
+        """
+        returns = daily_returns(closes)
+        benchmark_returns = daily_returns(benchmark_closes)
+        return_dates = dates[1:]  # a return is dated by the day it ends on
+        if len(return_dates) < self.window:
+            raise ValueError('need at least {} daily returns, got {}'.format(self.window, len(return_dates)))
+        all_end_rows = np.arange(self.window - 1, len(return_dates))
+
+        # windows ending on or after the last date every ticker has a close are provisional: ingest may have stopped
+        # part way through the universe or stored a partial intraday bar, so the next refresh recomputes them
+        last_valid = len(dates) - 1 - np.argmax(~np.isnan(np.column_stack([closes, benchmark_closes]))[::-1], axis=0)
+        recompute_from = dates[last_valid.min()]
+
+        cached = None
+        previous = self.results
+        if previous is not None and 'recompute_from' in previous and list(previous['tickers']) == list(tickers):
+            settled = previous['beta_dates'] < previous['recompute_from']  # universe unchanged, drop provisional rows
+            settled_matrices = previous['matrix_dates'] < previous['recompute_from']
+            if settled.any():
+                cached = {
+                    'beta_dates': previous['beta_dates'][settled],
+                    'beta': previous['beta'][settled],
+                    'matrix_dates': previous['matrix_dates'][settled_matrices],
+                    'cov': previous['cov'][settled_matrices],
+                    'corr': previous['corr'][settled_matrices]
+                }
+        if cached is not None:
+            new_end_rows = all_end_rows[return_dates[all_end_rows] > cached['beta_dates'][-1]]
+        else:
+            new_end_rows = all_end_rows  # first run, older cache file, nothing settled or the universe changed
+
+        first = new_end_rows[0] - (self.window - 1) if len(new_end_rows) else len(return_dates)
+        new_beta = rolling_beta(returns[first:], benchmark_returns[first:], self.window, self.dtype)
+        matrix_end_rows = new_end_rows[-self.matrix_history:] if self.matrix_history else new_end_rows[:0]
+        new_cov, new_corr = rolling_covariance(returns, self.window, matrix_end_rows, self.dtype, self.chunk_size)
+
+        if cached is None:
+            results = {
+                'beta_dates': return_dates[new_end_rows],
+                'tickers': np.array(tickers),
+                'beta': new_beta,
+                'matrix_dates': return_dates[matrix_end_rows],
+                'cov': new_cov,
+                'corr': new_corr,
+                'recompute_from': recompute_from
+            }
+        else:
+            keep = slice(-self.matrix_history, None) if self.matrix_history else slice(0, 0)
+            results = {
+                'beta_dates': np.concatenate([cached['beta_dates'], return_dates[new_end_rows]]),
+                'tickers': np.array(tickers),
+                'beta': np.concatenate([cached['beta'], new_beta]),
+                'matrix_dates': np.concatenate([cached['matrix_dates'], return_dates[matrix_end_rows]])[keep],
+                'cov': np.concatenate([cached['cov'], new_cov])[keep],
+                'corr': np.concatenate([cached['corr'], new_corr])[keep],
+                'recompute_from': recompute_from
+            }
+        self.results = results
+        self._save_cache()  # recompute_from moves even when no new window was added
+        return results
+
+
+def refresh_risk_metrics(windows=(63, 126, 252), benchmark='SPY', dtype=np.float64, matrix_history=21,
+                         cache_dir='risk_cache'):
+    """
+    Purpose: Load the stored daily closes once and refresh the cached risk metrics of every window
+    Parameters:
+        windows: window lengths in trading days, one RiskEngine and cache file per window
+        benchmark: ticker the betas are measured against. Taken from the stored universe when it is a constituent,
+                   otherwise fetched from finnhub with load_benchmark_closes
+    Return:
+        {window: results of RiskEngine.refresh}
+    """
+    client = MongoClient('localhost', 27017)
+    collection = client['Stock_Intellegence']['SP500']
+    dates, tickers, closes = load_daily_closes(collection)
+    if benchmark in tickers:
+        benchmark_closes = closes[:, tickers.index(benchmark)]
+    else:
+        benchmark_closes = load_benchmark_closes(benchmark, dates)
+    universe = [j for j, ticker in enumerate(tickers) if ticker != benchmark]
+    tickers = [tickers[j] for j in universe]
+    closes = closes[:, universe]
+
+    results = {}
+    for window in windows:
+        engine = RiskEngine(window, benchmark, dtype, matrix_history=matrix_history, cache_dir=cache_dir)
+        results[window] = engine.refresh(dates, tickers, closes, benchmark_closes)
+    client.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--windows', type=int, nargs='+', default=[63, 126, 252], help="window lengths in trading days")
+    parser.add_argument('--benchmark', type=str, default='SPY', help="ticker the betas are measured against")
+    parser.add_argument('--float32', action='store_true', help="store results as float32 to halve their memory")
+    parser.add_argument('--matrix-history', type=int, default=21, help="how many recent matrices to keep per window")
+
+    namespace = parser.parse_args()
+    refresh_risk_metrics(namespace.windows, namespace.benchmark, np.float32 if namespace.float32 else np.float64,
+                         namespace.matrix_history)
@@ -0,0 +1,70 @@
+import numpy as np
+
+RESOLUTION_LABELS = {
+    'D': 'daily',
+    'W': 'weekly',
+    'M': 'monthly'
+}
+
+
+def decode_series(date_dict_ls):
+    """
+    Purpose: Turn the [{date: {field: value}}, ...] lists stored by mongo_connection.py into one numpy array per field
+    Parameters:
+        date_dict_ls: list of single key dictionaries, the key is a 'YYYY-MM-DD' date
+    Return:
+        {'dates': datetime64[D][], field: double[], ...}  # rows are sorted by date
+    """
+    dates = []
+    rows = []
+    for date_dict in date_dict_ls:
+        for date, values in date_dict.items():
+            dates.append(date)
+            rows.append(values)
+    fields = list(rows[0].keys()) if rows else []
+    series = {'dates': np.array(dates, dtype='datetime64[D]')}
+    for field in fields:
+        series[field] = np.array([row.get(field) for row in rows], dtype=np.float64)  # missing values (None) become nan
+    order = np.argsort(series['dates'], kind='stable')
+    if np.any(order != np.arange(len(order))):
+        series = {field: arr[order] for field, arr in series.items()}
+    return series
+
+
+def decode_ticker_document(document):
+    """
+    Purpose: Decode a whole ticker document into contiguous arrays once, so that repeated queries only slice arrays
+    Parameters:
+        document: a ticker document as inserted by mongo_connection.store_ticker_data_to_db
+    Return:
+        {
+            'ticker': 'AAPL',
+            'profile': {'name': ..., 'industry': ..., ...},
+            'price': {'D': series, 'W': series, 'M': series},
+            'indicators': {('D', 'ema'): series, ...}
+        }
+    """
+    label_to_resolution = {label: resolution for resolution, label in RESOLUTION_LABELS.items()}
+    price = {}
+    for price_dict in document.get('price', []):
+        for resolution_label, date_dict_ls in price_dict.items():
+            resolution = label_to_resolution[resolution_label.split('_')[0]]
+            price[resolution] = decode_series(date_dict_ls)
+    indicators = {}
+    for indicator_label, date_dict_ls in document.get('indicators', {}).items():  # e.g. 'daily_ema'
+        resolution_label, indicator = indicator_label.split('_', 1)
+        indicators[(label_to_resolution[resolution_label], indicator)] = decode_series(date_dict_ls)
+    profile = {key: document.get(key) for key in ['name', 'industry', 'exchange', 'ipo', 'currency']}
+    return {'ticker': document['ticker'], 'profile': profile, 'price': price, 'indicators': indicators}
+
+
+def slice_series(series, start, end):
+    """
+    Purpose: Get the rows of a decoded series between start and end (both inclusive, 'YYYY-MM-DD' or None)
+    Return:
+        the same dictionary layout as series, every array is a view into the cached arrays
+    """
+    dates = series['dates']
+    lo = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'D'), side='left')
+    hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, 'D'), side='right')
+    return {field: arr[lo:hi] for field, arr in series.items()}
@@ -7,6 +7,39 @@ def convert_epoch_to_datetime(epoch):
     return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(epoch))
 
 
+def get_news_articles(ticker, startDate, endDate):
+    """
+    Purpose: Get the raw news articles pertaining to a stock, including the article summary
+    :param ticker: Ticker symbol of a stock
+    :param startDate: When to start looking for news articles. Format is: 'YYYY-MM-DD'
+    :param endDate: When to stop looking for news articles. Format is: 'YYYY-MM-DD'
+    :return:
+        Example Return:
+            [
+              {
+                "category": "company news",
+                "datetime": 1569550360,
+                "headline": "More sops needed to boost electronic manufacturing: Top govt official",
+                "id": 25286,
+                "image": "https://img.etimg.com/thumb/msid-71321314.jpg",
+                "related": "AAPL",
+                "source": "The Economic Times India",
+                "summary": "NEW DELHI | KOLKATA: Even as the Centre is working on a package of sops for electronic manufacturing...",
+                "url": "https://economictimes.indiatimes.com/articleshow/71321308.cms"
+              }
+            ]
+    """
+    while True:
+        try:
+            data = requests.get('https://finnhub.io/api/v1/company-news?symbol={}&from={}&to={}&token=br3gbbnrh5rai6tghkig'.format(ticker, startDate, endDate)).json()
+            if not isinstance(data, list):  # errors like the rate limit come back as {"error": ...}
+                raise ValueError(data)
+            return data
+        except:
+            print('api call error occured... waiting ', delay, ' seconds, then recalling api')
+            time.sleep(delay)
+
+
 def get_news(ticker, startDate, endDate):
     """
     Purpose: Get a list of news urls pertaining to a stock
@@ -21,9 +54,12 @@ def get_news(ticker, startDate, endDate):
     datetime = []
     headline = []
     url = []
-    data = requests.get('https://finnhub.io/api/v1/company-news?symbol={}&from={}&to={}&token=br3gbbnrh5rai6tghkig'.format(ticker, startDate, endDate)).json()
+    data = get_news_articles(ticker, startDate, endDate)
     for article in range(len(data)):
         headline.append(data[article]['headline'])
         url.append(data[article]['url'])
         datetime.append(convert_epoch_to_datetime(data[article]['datetime']))
     return headline, url, datetime
+
+
+delay = 10  # if there is an error with API call, wait this delay in seconds, then recall api
@@ -31,24 +31,13 @@ def build_ticker_data(ticker, ticker_data, counter):
             resolution_label = 'weekly_prices'
         else:
             resolution_label = 'monthly_prices'
-        price_dict = {resolution_label: []}
-        for i in range(len(epoch_ls)):
-            date = tc.convert_epoch_to_datetime(epoch_ls[i])
-            open = open_ls[i]
-            high = high_ls[i]
-            low = low_ls[i]
-            close = close_ls[i]
-            volume = volume_ls[i]
-            date_dict = {
-                date: {
-                    'open': open,
-                    'high': high,
-                    'low': low,
-                    'close': close,
-                    'volume': volume
-                }
-            }
-            price_dict[resolution_label].append(date_dict)
+        price_dict = {resolution_label: tc.build_date_dicts(epoch_ls, {
+            'open': open_ls,
+            'high': high_ls,
+            'low': low_ls,
+            'close': close_ls,
+            'volume': volume_ls
+        })}
         ticker_data['price'].append(price_dict)
 
     # get indicators
@@ -66,63 +55,51 @@ def build_ticker_data(ticker, ticker_data, counter):
     daily_epoch_ls = tc.get_indicator_epoch(ticker, 'D', y2020, int(time.time()))
     daily_ema_2d_ls = []
     for timeperiod in daily_ema_timeperiods_ls:
-        daily_ema_2d_ls.append(tc.get_ema(ticker, 'D', y2020, int(time.time()), timeperiod))
+        values, series_epoch_ls = tc.get_ema(ticker, 'D', y2020, int(time.time()), timeperiod, withEpoch=True)
+        daily_ema_2d_ls.append(tc.align_to_epochs(daily_epoch_ls, series_epoch_ls, values))
         # time.sleep(1)  # delay to avoid the 60 api calls / min limitation that finnhub imposes
-    for i in range(len(daily_epoch_ls)):
-        date = tc.convert_epoch_to_datetime(daily_epoch_ls[i])
-        date_dict = {
-            date: {
-                '2-day': daily_ema_2d_ls[0][i],
-                '5-day': daily_ema_2d_ls[1][i],
-                '10-day': daily_ema_2d_ls[2][i],
-                '21-day': daily_ema_2d_ls[3][i],
-                '50-day': daily_ema_2d_ls[4][i],
-                '100-day': daily_ema_2d_ls[5][i],
-                '200-day': daily_ema_2d_ls[6][i]
-            }
-        }
-        ema_dict['daily_ema'].append(date_dict)
+    ema_dict['daily_ema'] = tc.build_date_dicts(daily_epoch_ls, {
+        '2-day': daily_ema_2d_ls[0],
+        '5-day': daily_ema_2d_ls[1],
+        '10-day': daily_ema_2d_ls[2],
+        '21-day': daily_ema_2d_ls[3],
+        '50-day': daily_ema_2d_ls[4],
+        '100-day': daily_ema_2d_ls[5],
+        '200-day': daily_ema_2d_ls[6]
+    })
     # get weekly ema
     weekly_ema_timeperiods_ls = [1, 2, 4, 10, 20, 30, 40]
     weekly_epoch_ls = tc.get_indicator_epoch(ticker, 'W', y2020, int(time.time()))
     weekly_ema_2d_ls = []
     for timeperiod in weekly_ema_timeperiods_ls:
-        weekly_ema_2d_ls.append(tc.get_ema(ticker, 'W', y2020, int(time.time()), timeperiod))
+        values, series_epoch_ls = tc.get_ema(ticker, 'W', y2020, int(time.time()), timeperiod, withEpoch=True)
+        weekly_ema_2d_ls.append(tc.align_to_epochs(weekly_epoch_ls, series_epoch_ls, values))
         # time.sleep(1)
-    for i in range(len(weekly_epoch_ls)):
-        date = tc.convert_epoch_to_datetime(weekly_epoch_ls[i])
-        date_dict = {
-            date: {
-                '1-week': weekly_ema_2d_ls[0][i],
-                '2-week': weekly_ema_2d_ls[1][i],
-                '4-wwek': weekly_ema_2d_ls[2][i],
-                '10-week': weekly_ema_2d_ls[3][i],
-                '20-week': weekly_ema_2d_ls[4][i],
-                '30-week': weekly_ema_2d_ls[5][i],
-                '40-week': weekly_ema_2d_ls[6][i]
-            }
-        }
-        ema_dict['weekly_ema'].append(date_dict)
+    ema_dict['weekly_ema'] = tc.build_date_dicts(weekly_epoch_ls, {
+        '1-week': weekly_ema_2d_ls[0],
+        '2-week': weekly_ema_2d_ls[1],
+        '4-wwek': weekly_ema_2d_ls[2],
+        '10-week': weekly_ema_2d_ls[3],
+        '20-week': weekly_ema_2d_ls[4],
+        '30-week': weekly_ema_2d_ls[5],
+        '40-week': weekly_ema_2d_ls[6]
+    })
     # get monthly ema
     monthly_ema_timeperiods_ls = [1, 2, 5, 7, 8, 10]
     monthly_epoch_ls = tc.get_indicator_epoch(ticker, 'M', y2020, int(time.time()))
     monthly_ema_2d_ls = []
     for timeperiod in monthly_ema_timeperiods_ls:
-        monthly_ema_2d_ls.append(tc.get_ema(ticker, 'M', y2020, int(time.time()), timeperiod))
+        values, series_epoch_ls = tc.get_ema(ticker, 'M', y2020, int(time.time()), timeperiod, withEpoch=True)
+        monthly_ema_2d_ls.append(tc.align_to_epochs(monthly_epoch_ls, series_epoch_ls, values))
         # time.sleep(1)
-    for i in range(len(monthly_epoch_ls)):
-        date = tc.convert_epoch_to_datetime(monthly_epoch_ls[i])
-        date_dict = {
-            date: {
-                '1-month': monthly_ema_2d_ls[0][i],
-                '2-month': monthly_ema_2d_ls[1][i],
-                '5-month': monthly_ema_2d_ls[2][i],
-                '7-month': monthly_ema_2d_ls[3][i],
-                '8-month': monthly_ema_2d_ls[4][i],
-                '10-month': monthly_ema_2d_ls[5][i]
-            }
-        }
-        ema_dict['monthly_ema'].append(date_dict)
+    ema_dict['monthly_ema'] = tc.build_date_dicts(monthly_epoch_ls, {
+        '1-month': monthly_ema_2d_ls[0],
+        '2-month': monthly_ema_2d_ls[1],
+        '5-month': monthly_ema_2d_ls[2],
+        '7-month': monthly_ema_2d_ls[3],
+        '8-month': monthly_ema_2d_ls[4],
+        '10-month': monthly_ema_2d_ls[5]
+    })
 
     ticker_data['indicators'] = ema_dict
     counter += 1